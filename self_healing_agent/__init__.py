@@ -12,4 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from . import agent
+import importlib
+
+
+def __getattr__(name):
+    # Import the agent module on first access (e.g. by the ADK loader) so
+    # importing the package or its tools does not build every agent
+    if name == "agent":
+        return importlib.import_module(f"{__name__}.agent")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
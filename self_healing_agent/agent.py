@@ -1,20 +1,26 @@
 # self_healing_agent/agent.py
 
 from google.adk.agents import Agent
-import json
-from typing import Any, Dict
 
 from .prompt import agent_instruction
-from .tools.tools import get_current_date, analysis_agent_tool , jira_agent_tool, code_fixer_agent_tool 
+from .tools.tools import (
+    get_current_date,
+    get_analysis_agent_tool,
+    get_jira_agent_tool,
+    get_code_fixer_agent_tool,
+    prefetch_tools,
+)
+
+prefetch_tools()
 
 root_agent = Agent(
     model="gemini-2.5-flash",
     name="self_healing_agent",
     instruction=agent_instruction,
     tools=[
-        analysis_agent_tool,
-        jira_agent_tool, 
-        code_fixer_agent_tool,
+        get_analysis_agent_tool(),
+        get_jira_agent_tool(),
+        get_code_fixer_agent_tool(),
         get_current_date
     ],
 )
\ No newline at end of file
@@ -1,12 +1,21 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import cache
+import importlib
 import os
 import json
 import logging
-from typing import Any, Dict, List, Union
+import textwrap
+import types
+from typing import Any, Dict, Iterable, List, Optional
 
 from google.adk.agents import Agent
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.tools import google_search
 from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
 from google.adk.tools.langchain_tool import LangchainTool
 from google.adk.tools.mcp_tool import MCPToolset, StreamableHTTPConnectionParams
 from langchain_community.tools import StackExchangeTool
@@ -15,263 +24,403 @@ from toolbox_core import ToolboxSyncClient
 
 from dotenv import load_dotenv
 
+try:
+    from pydantic.networks import AnyUrl as _AnyUrl
+except ImportError:
+    try:
+        from pydantic import AnyUrl as _AnyUrl
+    except ImportError:
+        # Nothing to convert without pydantic; isinstance(x, ()) is False
+        _AnyUrl = ()
+
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Module logger; logging is configured by the host application
 logger = logging.getLogger(__name__)
 
+# GitHub token for the MCP tools; checked before any other setup so a
+# misconfigured environment fails immediately
+GITHUB_TOKEN = os.getenv("GITHUB_PERSONAL_ACCESS_TOKEN")
+if not GITHUB_TOKEN:
+    logger.error("GITHUB_PERSONAL_ACCESS_TOKEN not found in environment variables")
+    raise ValueError("GitHub token is required")
+
+github_headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
+
 # ----- Utility Function -----
+# Result for the day it was computed, reused until the day changes
+_cached_date_ordinal = -1
+_cached_date_result: Dict[str, str] = {}
+
 def get_current_date() -> dict:
     """Get the current date in the format YYYY-MM-DD"""
-    return {"current_date": datetime.now().strftime("%Y-%m-%d")}
+    global _cached_date_ordinal, _cached_date_result
+    now = datetime.now()
+    ordinal = now.toordinal()
+    if ordinal != _cached_date_ordinal:
+        _cached_date_result = {"current_date": now.strftime("%Y-%m-%d")}
+        _cached_date_ordinal = ordinal
+    return _cached_date_result
+
+# JSON-native leaf types that never need conversion
+_SAFE_TYPES = (str, int, float, bool, type(None))
 
-def convert_anyurl_to_string(obj: Any) -> Any:
+def convert_anyurl_to_string(obj: Any, in_place: bool = True) -> Any:
     """
-    Recursively convert AnyUrl objects to strings to fix JSON serialization issues.
+    Convert AnyUrl objects to strings to fix JSON serialization issues.
     This is a workaround for the AnyUrl serialization bug in the ADK.
+    Dicts and lists are walked iteratively and updated in place; pass
+    in_place=False to convert copies and leave the input untouched.
+    Shared and cyclic containers are visited once.
     """
-    if isinstance(obj, dict):
-        return {k: convert_anyurl_to_string(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_anyurl_to_string(i) for i in obj]
-    elif hasattr(obj, "__str__") and type(obj).__name__ == "AnyUrl":
+    if not isinstance(obj, (dict, list)):
+        if isinstance(obj, _AnyUrl):
+            return str(obj)
+        return obj
+
+    root = obj if in_place else obj.copy()
+    # id of each container seen -> the container (or copy) being converted
+    visited = {id(obj): root}
+    stack = [root]
+    while stack:
+        container = stack.pop()
+        items = container.items() if isinstance(container, dict) else enumerate(container)
+        for key, value in items:
+            t = type(value)
+            if t in _SAFE_TYPES:
+                continue
+            if t is dict or t is list or isinstance(value, (dict, list)):
+                if not value:
+                    continue
+                converted = visited.get(id(value))
+                if converted is None:
+                    converted = value if in_place else value.copy()
+                    visited[id(value)] = converted
+                    stack.append(converted)
+                if converted is not value:
+                    container[key] = converted
+            elif isinstance(value, _AnyUrl):
+                container[key] = str(value)
+    return root
+
+def _anyurl_default(obj: Any) -> str:
+    """json.dumps default hook that serializes AnyUrl objects as strings."""
+    if isinstance(obj, _AnyUrl):
         return str(obj)
-    return obj
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Built once so safe_json_dumps does not construct an encoder per call
+_SAFE_ENCODER = json.JSONEncoder(default=_anyurl_default)
 
 def safe_json_dumps(data: Any) -> str:
     """
     Safely serialize data to JSON, handling AnyUrl objects.
     """
     try:
-        converted_data = convert_anyurl_to_string(data)
-        return json.dumps(converted_data)
+        return _SAFE_ENCODER.encode(data)
     except Exception as e:
-        logger.error(f"Error serializing data: {e}")
+        logger.error("Error serializing data: %s", e)
         # Fallback to string representation
         return str(data)
 
 # ----- Monkey Patch for AnyUrl Issue -----
 # This patches the issue at runtime without modifying the installed package
 
-try:
-    import google.genai._api_client as api_client
-    
-    # Store the original method
-    original_method = None
-    if hasattr(api_client, 'HttpRequest'):
-        # Find the method that handles JSON serialization
-        # This is a defensive approach since the internal structure might change
-        logger.info("Applying AnyUrl serialization fix...")
-        
-        # Create a custom JSON encoder that handles AnyUrl
-        class SafeJSONEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if hasattr(obj, "__str__") and type(obj).__name__ == "AnyUrl":
-                    return str(obj)
-                return super().default(obj)
-        
-        # Monkey patch json.dumps to use our safe encoder
-        original_json_dumps = json.dumps
-        def patched_json_dumps(obj, **kwargs):
-            try:
-                # Try with our safe encoder first
-                kwargs['cls'] = SafeJSONEncoder
-                return original_json_dumps(obj, **kwargs)
-            except TypeError:
-                # Fallback to converting the object first
-                converted_obj = convert_anyurl_to_string(obj)
-                return original_json_dumps(converted_obj, **kwargs)
-        
-        # Apply the patch
-        json.dumps = patched_json_dumps
-        logger.info("AnyUrl serialization fix applied successfully")
-        
-except ImportError as e:
-    logger.warning(f"Could not apply AnyUrl fix: {e}. Manual fix may be required.")
+def _genai_encodes_anyurl() -> bool:
+    """
+    Check whether google-genai's own request encoding already makes AnyUrl
+    values JSON-serializable, in which case the patch is not needed.
+    """
+    try:
+        from google.genai import _common
+        encoded = _common.encode_unserializable_types({"url": _AnyUrl("https://example.com")})
+        json.dumps(encoded)
+    except Exception:
+        return False
+    return True
+
+# Decided once per process
+_ANYURL_PATCH_NEEDED = not _genai_encodes_anyurl()
+
+# google-genai modules that serialize payloads with json.dumps: the REST
+# API client and the Live API session (e.g. send_tool_response)
+_ANYURL_PATCH_MODULES = ("google.genai._api_client", "google.genai.live")
+
+# Patch json.dumps, as seen by those modules only, to serialize AnyUrl via
+# a default hook
+original_json_dumps = json.dumps
+def patched_json_dumps(obj, **kwargs):
+    if 'cls' not in kwargs and 'default' not in kwargs:
+        # A plain default hook keeps encoding on the C fast path
+        kwargs['default'] = _anyurl_default
+        return original_json_dumps(obj, **kwargs)
+    try:
+        return original_json_dumps(obj, **kwargs)
+    except TypeError:
+        # Fallback to converting a copy, leaving the caller's data as-is
+        converted_obj = convert_anyurl_to_string(obj, in_place=False)
+        return original_json_dumps(converted_obj, **kwargs)
+
+# Mark the patch and keep the original so tests can unwind it
+patched_json_dumps._anyurl_patched = True
+patched_json_dumps._original = original_json_dumps
+
+for module_name in _ANYURL_PATCH_MODULES:
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        logger.warning("Could not apply AnyUrl fix to %s: %s. Manual fix may be required.", module_name, e)
+        continue
+
+    # Re-importing this module (reloads, autoreload) must not stack patches
+    module_dumps = getattr(getattr(module, 'json', None), 'dumps', None)
+    if getattr(module_dumps, '_anyurl_patched', False):
+        logger.debug("AnyUrl serialization fix already applied to %s", module_name)
+    elif _ANYURL_PATCH_NEEDED and getattr(module, 'json', None) is json:
+        # Apply the patch to a private copy of the json module so other
+        # json.dumps callers in the process are unaffected
+        module_json = types.ModuleType(json.__name__)
+        module_json.__dict__.update(json.__dict__)
+        module_json.dumps = patched_json_dumps
+        module.json = module_json
+        logger.debug("AnyUrl serialization fix applied to %s", module_name)
+
+# ----- Agent Instructions -----
+# Dedented once at import so the prompts carry no indentation tokens
+
+_SEARCH_INSTRUCTION = textwrap.dedent("""
+    Search Google for technical documentation, bug reports and fixes for programming
+    issues. Return concise, actionable findings.
+    """).strip()
+
+_ANALYSIS_INSTRUCTION = textwrap.dedent("""
+    You are a senior engineer analyzing bugs.
+
+    1. Find the root cause from the error logs and stack traces
+    2. Read the relevant repository files
+    3. Search for similar issues and fixes (web, StackOverflow, GitHub)
+    4. Return a bug report: problem, root cause, impact, suggested fix, relevant code
+    """).strip()
+
+_JIRA_INSTRUCTION = textwrap.dedent("""
+    You manage JIRA tickets.
+
+    1. Create tickets from bug reports: title, description, priority, labels,
+       acceptance criteria
+    2. Update tickets: add PR links, update status, add progress comments
+    3. Report failures clearly
+    """).strip()
+
+_CODE_FIXER_INSTRUCTION = textwrap.dedent("""
+    You are a developer implementing bug fixes.
+
+    1. Create a branch for the fix
+    2. Make minimal, targeted changes that follow the existing code style; add
+       tests where applicable
+    3. Open a PR describing the problem, solution, changes and testing
+    """).strip()
 
 # ----- Initialize Base Tools -----
 
 # Search Agent for web searches
-search_agent = Agent(
-    model="gemini-2.5-flash",
-    name="search_agent",
-    instruction="""
-    You're a specialist in Google Search. Focus on finding relevant technical documentation,
-    bug reports, and solutions for programming issues. Provide concise, actionable information.
-    """,
-    tools=[google_search],
-)
-search_tool = AgentTool(search_agent)
+@cache
+def get_search_tool() -> AgentTool:
+    """Build the Google Search agent and wrap it as a tool."""
+    search_agent = Agent(
+        model="gemini-2.5-flash",
+        name="search_agent",
+        instruction=_SEARCH_INSTRUCTION,
+        tools=[google_search],
+    )
+    return AgentTool(search_agent)
 
 # StackOverflow tool for technical Q&A
-stack_exchange_tool = StackExchangeTool(api_wrapper=StackExchangeAPIWrapper())
-stackoverflow_tool = LangchainTool(stack_exchange_tool)
+@cache
+def get_stackoverflow_tool() -> LangchainTool:
+    """Build the StackExchange tool; its API client looks up sites over HTTP."""
+    stack_exchange_tool = StackExchangeTool(api_wrapper=StackExchangeAPIWrapper())
+    return LangchainTool(stack_exchange_tool)
 
 # Toolbox for JIRA operations
 TOOLBOX_URL = os.getenv("MCP_TOOLBOX_URL", "http://127.0.0.1:5000")
-try:
-    toolbox = ToolboxSyncClient(TOOLBOX_URL)
-    toolbox_tools = toolbox.load_toolset("tickets_toolset")
-    logger.info("Toolbox JIRA tools loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load toolbox tools: {e}")
-    toolbox_tools = []
-
-# MCP Tools for GitHub operations
-GITHUB_TOKEN = os.getenv("GITHUB_PERSONAL_ACCESS_TOKEN")
-if not GITHUB_TOKEN:
-    logger.error("GITHUB_PERSONAL_ACCESS_TOKEN not found in environment variables")
-    raise ValueError("GitHub token is required")
 
-github_headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
+# Shared worker pool for blocking tool setup
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+@cache
+def get_toolbox_tools() -> list:
+    """Load the JIRA toolset from the MCP Toolbox server."""
+    try:
+        toolbox = ToolboxSyncClient(TOOLBOX_URL)
+        toolbox_tools = toolbox.load_toolset("tickets_toolset")
+        logger.debug("Toolbox JIRA tools loaded successfully")
+    except Exception as e:
+        logger.error("Failed to load toolbox tools: %s", e)
+        toolbox_tools = []
+    return toolbox_tools
 
 # Analysis tools (read-only)
-try:
-    mcp_tools_analyse = MCPToolset(
-        connection_params=StreamableHTTPConnectionParams(
-            url="https://api.githubcopilot.com/mcp/",
-            headers=github_headers,
-        ),
-        tool_filter=[
-            "get_file_contents",
-            "get_commit",
-            "search_issues",
-            "list_issues",
-            "get_issue",
-            "search_repositories",
-            "list_pull_requests",
-            "get_pull_request",
-        ],
-    )
-    logger.info("GitHub analysis tools initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize GitHub analysis tools: {e}")
-    mcp_tools_analyse = None
+_MCP_ANALYSE_TOOLS = frozenset({
+    "get_file_contents",
+    "get_commit",
+    "search_issues",
+    "list_issues",
+    "get_issue",
+    "search_repositories",
+    "list_pull_requests",
+    "get_pull_request",
+})
 
 # PR and code modification tools
-try:
-    mcp_tools_pr = MCPToolset(
-        connection_params=StreamableHTTPConnectionParams(
-            url="https://api.githubcopilot.com/mcp/",
-            headers=github_headers,
-        ),
-        tool_filter=[
-            "create_pull_request",
-            "update_pull_request",
-            "create_branch",
-            "create_or_update_file",
-            "delete_file",
-            "list_branches",
-            "push_files",
-            "get_pull_request",
-            "get_file_contents",
-        ],
-    )
-    logger.info("GitHub PR tools initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize GitHub PR tools: {e}")
-    mcp_tools_pr = None
+_MCP_PR_TOOLS = frozenset({
+    "create_pull_request",
+    "update_pull_request",
+    "create_branch",
+    "create_or_update_file",
+    "delete_file",
+    "list_branches",
+    "push_files",
+    "get_pull_request",
+    "get_file_contents",
+})
+
+class FilteredToolset(BaseToolset):
+    """
+    Expose a named subset of another toolset's tools.
+    Lets several agents share one underlying MCP session.
+    """
+
+    def __init__(self, toolset: BaseToolset, tool_names: Iterable[str]):
+        super().__init__()
+        self._toolset = toolset
+        self._tool_names = frozenset(tool_names)
+
+    async def get_tools(
+        self, readonly_context: Optional[ReadonlyContext] = None
+    ) -> List[BaseTool]:
+        tools = await self._toolset.get_tools(readonly_context)
+        return [tool for tool in tools if tool.name in self._tool_names]
+
+    async def close(self) -> None:
+        # The view does not own the shared toolset; closing it here would end
+        # the session for every other view. Its owner closes it.
+        pass
+
+class CachedToolset(BaseToolset):
+    """
+    Fetch another toolset's tools once and reuse them on later calls.
+    Filtered views of a shared toolset then cost one list_tools round trip.
+    """
+
+    def __init__(self, toolset: BaseToolset):
+        super().__init__()
+        self._toolset = toolset
+        self._tools: Optional[List[BaseTool]] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get_tools(
+        self, readonly_context: Optional[ReadonlyContext] = None
+    ) -> List[BaseTool]:
+        if self._tools is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._tools is None:
+                    self._tools = await self._toolset.get_tools(readonly_context)
+        return self._tools
+
+    async def close(self) -> None:
+        self._tools = None
+        await self._toolset.close()
+
+@cache
+def get_github_toolset() -> Optional[CachedToolset]:
+    """
+    Build the single GitHub MCP toolset shared by the analysis and PR views.
+    The caller that owns this toolset is responsible for closing it.
+    """
+    try:
+        github_toolset = CachedToolset(
+            MCPToolset(
+                connection_params=StreamableHTTPConnectionParams(
+                    url="https://api.githubcopilot.com/mcp/",
+                    headers=github_headers,
+                ),
+                tool_filter=sorted(_MCP_ANALYSE_TOOLS | _MCP_PR_TOOLS),
+            )
+        )
+        logger.debug("GitHub MCP tools initialized successfully")
+    except Exception as e:
+        logger.error("Failed to initialize GitHub MCP tools: %s", e)
+        github_toolset = None
+    return github_toolset
+
+@cache
+def get_mcp_tools_analyse() -> Optional[FilteredToolset]:
+    """Read-only view of the shared GitHub MCP toolset."""
+    github_toolset = get_github_toolset()
+    if github_toolset is None:
+        return None
+    return FilteredToolset(github_toolset, _MCP_ANALYSE_TOOLS)
+
+@cache
+def get_mcp_tools_pr() -> Optional[FilteredToolset]:
+    """View of the shared GitHub MCP toolset used to create branches and PRs."""
+    github_toolset = get_github_toolset()
+    if github_toolset is None:
+        return None
+    return FilteredToolset(github_toolset, _MCP_PR_TOOLS)
+
+def prefetch_tools() -> None:
+    """
+    Run the blocking tool setups concurrently before the agents need them:
+    the toolbox toolset load and the StackExchange client's site lookup.
+    The GitHub MCP toolset is not included; it connects on first use.
+    """
+    futures = [_EXECUTOR.submit(getter) for getter in (get_toolbox_tools, get_stackoverflow_tool)]
+    for future in futures:
+        future.result()
 
 # ----- Specialized Agent Tools -----
 
 # 1. Analysis Agent Tool
-analysis_agent = Agent(
-    model="gemini-2.5-flash",
-    name="code_analysis_agent",
-    instruction="""
-    You are a senior software engineer specializing in code analysis and bug investigation.
-    
-    Your responsibilities:
-    1. Analyze error logs and stack traces to identify root causes
-    2. Examine relevant code files to understand the context
-    3. Search for similar issues and solutions online
-    4. Create comprehensive bug reports with:
-       - Clear problem description
-       - Root cause analysis
-       - Impact assessment
-       - Suggested solution approach
-       - Relevant code snippets
-    
-    Use the available tools to:
-    - Get file contents from repositories
-    - Search for similar issues
-    - Look up solutions on StackOverflow
-    - Research best practices
-    
-    IMPORTANT: When using GitHub MCP tools, be aware of potential AnyUrl serialization issues.
-    If you encounter JSON serialization errors, the system has been patched to handle them.
-    
-    Always provide detailed, actionable analysis.
-    """,
-    tools=[search_tool, stackoverflow_tool, mcp_tools_analyse, get_current_date],
-)
-analysis_agent_tool = AgentTool(analysis_agent)
+@cache
+def get_analysis_agent_tool() -> AgentTool:
+    """Build the code analysis agent and wrap it as a tool."""
+    analysis_agent = Agent(
+        model="gemini-2.5-flash",
+        name="code_analysis_agent",
+        instruction=_ANALYSIS_INSTRUCTION,
+        tools=[
+            get_search_tool(),
+            get_stackoverflow_tool(),
+            get_mcp_tools_analyse(),
+            get_current_date,
+        ],
+    )
+    return AgentTool(analysis_agent)
 
 # 2. JIRA Agent Tool
-jira_agent = Agent(
-    model="gemini-2.5-flash",
-    name="jira_management_agent",
-    instruction="""
-    You are a project management specialist responsible for JIRA ticket operations.
-    
-    Your responsibilities:
-    1. Create detailed JIRA tickets from bug reports
-    2. Update existing tickets with new information
-    3. Link tickets with PR requests
-    4. Maintain proper ticket status and workflow
-    
-    When creating tickets, include:
-    - Clear, descriptive title
-    - Detailed description with bug analysis
-    - Priority and severity levels
-    - Labels and components
-    - Acceptance criteria
-    
-    When updating tickets:
-    - Add PR links and details
-    - Update status appropriately
-    - Add relevant comments about progress
-    
-    Handle errors gracefully and provide meaningful feedback if JIRA operations fail.
-    """,
-    tools=toolbox_tools + [get_current_date],
-)
-jira_agent_tool = AgentTool(jira_agent)
+@cache
+def get_jira_agent_tool() -> AgentTool:
+    """Build the JIRA management agent and wrap it as a tool."""
+    jira_agent = Agent(
+        model="gemini-2.5-flash",
+        name="jira_management_agent",
+        instruction=_JIRA_INSTRUCTION,
+        tools=[*get_toolbox_tools(), get_current_date],
+    )
+    return AgentTool(jira_agent)
 
 # 3. Code Fixer Agent Tool
-code_fixer_agent = Agent(
-    model="gemini-2.5-flash",
-    name="code_fixer_agent",
-    instruction="""
-    You are an expert software developer specializing in bug fixes and code improvements.
-    
-    Your responsibilities:
-    1. Implement bug fixes based on analysis reports
-    2. Create new branches for fixes
-    3. Make necessary code changes
-    4. Create comprehensive pull requests
-    5. Ensure code quality and best practices
-    
-    When fixing code:
-    - Follow existing code style and patterns
-    - Add appropriate comments and documentation
-    - Include unit tests if applicable
-    - Make minimal, targeted changes
-    
-    When creating PRs:
-    - Write clear, descriptive titles
-    - Include detailed descriptions with:
-      - Problem description
-      - Solution approach
-      - Changes made
-      - Testing notes
-    - Link to related issues/tickets
-    
-    IMPORTANT: The system has been patched to handle AnyUrl serialization issues.
-    If you encounter any JSON serialization errors with GitHub operations, they should be automatically handled.
-    """,
-    tools=[mcp_tools_pr, mcp_tools_analyse, get_current_date],
-)
-code_fixer_agent_tool = AgentTool(code_fixer_agent)
\ No newline at end of file
+@cache
+def get_code_fixer_agent_tool() -> AgentTool:
+    """Build the code fixer agent and wrap it as a tool."""
+    code_fixer_agent = Agent(
+        model="gemini-2.5-flash",
+        name="code_fixer_agent",
+        instruction=_CODE_FIXER_INSTRUCTION,
+        tools=[get_mcp_tools_pr(), get_mcp_tools_analyse(), get_current_date],
+    )
+    return AgentTool(code_fixer_agent)